@@ -0,0 +1,149 @@
+"""요청 단위 구간 측정 (Server-Timing, 느린 요청 로그, 샘플링 프로파일러)"""
+
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional
+
+# 느린 요청 기준(ms)과 기록 파일
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_LOG_FILE = os.getenv("SLOW_LOG_FILE", "config/slow_requests.log")
+
+# 샘플링 프로파일러: 0이면 비활성, 0~1 사이 비율로 요청을 cProfile로 측정
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "config/profiles")
+
+
+class _RequestSpans:
+    """한 요청의 구간별 실제 경과 시간(ms)
+
+    같은 이름의 구간이 여러 task/스레드에서 겹쳐 실행되면 합산하지 않고,
+    하나라도 실행 중이던 시간(wall-clock)만 셉니다. 따라서 각 구간 값은
+    total을 넘지 않습니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, float] = {}
+        self._active: Dict[str, int] = {}
+        self._started: Dict[str, float] = {}
+
+    def enter(self, name: str):
+        with self._lock:
+            count = self._active.get(name, 0)
+            if count == 0:
+                self._started[name] = time.perf_counter()
+                self._totals.setdefault(name, 0.0)
+            self._active[name] = count + 1
+
+    def exit(self, name: str):
+        with self._lock:
+            self._active[name] -= 1
+            if self._active[name] == 0:
+                elapsed = (time.perf_counter() - self._started.pop(name)) * 1000
+                self._totals[name] += elapsed
+
+    def totals(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._totals)
+
+
+# 현재 요청의 구간 기록
+_spans: ContextVar[Optional[_RequestSpans]] = ContextVar("spans", default=None)
+_profiling = False
+
+_slow_logger = logging.getLogger("slow_request")
+# 느린 요청은 전용 파일에만 기록하고 콘솔(root 로거)로 보내지 않음
+_slow_logger.propagate = False
+
+
+def _get_slow_logger() -> logging.Logger:
+    """느린 요청 전용 파일 로거 (첫 사용 시 핸들러 연결)"""
+    if not _slow_logger.handlers:
+        os.makedirs(os.path.dirname(SLOW_LOG_FILE) or ".", exist_ok=True)
+        handler = logging.FileHandler(SLOW_LOG_FILE, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _slow_logger.addHandler(handler)
+    return _slow_logger
+
+
+@contextmanager
+def span(name: str):
+    """이름 붙은 구간의 소요 시간을 현재 요청에 기록 (요청 밖에서는 무시)"""
+    spans = _spans.get()
+    if spans is None:
+        yield
+        return
+
+    spans.enter(name)
+    try:
+        yield
+    finally:
+        spans.exit(name)
+
+
+def _server_timing(spans: Dict[str, float], total: float) -> str:
+    parts = [f"{name};dur={dur:.1f}" for name, dur in spans.items()]
+    parts.append(f"total;dur={total:.1f}")
+    return ", ".join(parts)
+
+
+def _write_slow_log(request, status_code: int, spans: Dict[str, float], total: float):
+    record = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "method": request.method,
+        "path": request.url.path,
+        "query": request.url.query,
+        "status": status_code,
+        "total_ms": round(total, 1),
+        "spans": {name: round(dur, 1) for name, dur in spans.items()},
+    }
+    _get_slow_logger().warning(json.dumps(record, ensure_ascii=False))
+
+
+def _dump_profile(profiler: cProfile.Profile, request):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    path_tag = request.url.path.strip("/").replace("/", "_") or "root"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{stamp}-{path_tag}.prof"))
+
+
+async def timing_middleware(request, call_next):
+    """요청별 구간 시간을 Server-Timing 헤더로 붙이고 느린 요청을 기록"""
+    global _profiling
+
+    request_spans = _RequestSpans()
+    token = _spans.set(request_spans)
+
+    # cProfile은 동시에 하나만 켤 수 있으므로 이미 측정 중이면 건너뜀
+    profiler = None
+    if PROFILE_SAMPLE_RATE > 0 and not _profiling and random.random() < PROFILE_SAMPLE_RATE:
+        _profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        total = (time.perf_counter() - start) * 1000
+        _spans.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            _profiling = False
+            _dump_profile(profiler, request)
+
+    spans = request_spans.totals()
+    response.headers["Server-Timing"] = _server_timing(spans, total)
+
+    if total >= SLOW_REQUEST_MS:
+        _write_slow_log(request, response.status_code, spans, total)
+
+    return response
@@ -1,12 +1,18 @@
+import asyncio
 import json
 import os
+import shutil
+import tempfile
+import time
 from typing import List, Dict
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from common.profiling import span
+from config import log_store
 
 # 데이터 파일 경로
 PRODUCTS_FILE = "config/products.json"
 STORES_FILE = "config/stores.json"
-LOGS_FILE = "config/logs.json"
 
 # 기본 데이터
 DEFAULT_PRODUCTS = [
@@ -80,21 +86,58 @@ def load_json_file(file_path: str, default_data: List[Dict]) -> List[Dict]:
         return default_data
 
 
+# Windows에서는 다른 스레드가 열어 둔 파일로 os.replace하면 PermissionError가
+# 발생하므로 잠시 기다렸다가 다시 시도합니다.
+REPLACE_RETRIES = 5
+REPLACE_RETRY_DELAY = 0.01
+
+# mkstemp는 0600으로 파일을 만들므로 새 파일은 일반 파일 권한(0666 & ~umask)으로 맞춤
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _replace_file(src: str, dst: str):
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(REPLACE_RETRY_DELAY * (2**attempt))
+
+
 def save_json_file(file_path: str, data: List[Dict]):
-    """JSON 파일 저장"""
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """JSON 파일 저장 (임시 파일에 쓴 뒤 교체해 읽는 쪽에 중간 상태가 보이지 않음)"""
+    dir_path = os.path.dirname(file_path)
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dir_path, prefix=os.path.basename(file_path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+        _replace_file(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 def get_products() -> List[Dict]:
     """상품 목록 조회"""
-    return load_json_file(PRODUCTS_FILE, DEFAULT_PRODUCTS)
+    with span("products_read"):
+        return load_json_file(PRODUCTS_FILE, DEFAULT_PRODUCTS)
 
 
 def get_stores() -> List[Dict]:
     """매장 목록 조회"""
-    return load_json_file(STORES_FILE, DEFAULT_STORES)
+    with span("stores_read"):
+        return load_json_file(STORES_FILE, DEFAULT_STORES)
 
 
 def add_product(product_id: str, product_name: str, user_name: str):
@@ -160,25 +203,22 @@ def delete_store(store_id: str):
     save_json_file(STORES_FILE, stores)
 
 
-def add_log(
+def _make_log_entry(
+    products: List[Dict],
+    stores: List[Dict],
     action: str,
     user_name: str,
     product_id: str,
     store_id: str,
     result: str,
-    details: str = "",
-):
-    """로그 추가"""
-    logs = load_json_file(LOGS_FILE, [])
-
-    products = get_products()
-    stores = get_stores()
+    details: str,
+) -> Dict:
     product_name = next(
         (p["name"] for p in products if p["id"] == product_id), product_id
     )
     store_name = next((s["name"] for s in stores if s["id"] == store_id), store_id)
 
-    log_entry = {
+    return {
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "action": action,
         "user_name": user_name,
@@ -190,18 +230,95 @@ def add_log(
         "details": details,
     }
 
-    logs.insert(0, log_entry)  # 최신 로그를 맨 앞에
 
-    # 최대 1000개 로그만 유지
-    if len(logs) > 1000:
-        logs = logs[:1000]
+def _append_log(log_entry: Dict):
+    with span("log_write"):
+        log_store.append(log_entry)
+
+
+def get_logs(hours: int = 24, limit: int = 100) -> List[Dict]:
+    """최근 hours 시간 이내 로그를 최신순으로 최대 limit개 조회"""
+    since = datetime.now() - timedelta(hours=hours)
+    return log_store.query(since=since, limit=limit)
+
+
+# 비동기 API: 파일 I/O는 스레드 풀에서 실행하고, 같은 파일의 쓰기는 asyncio 락으로
+# 직렬화해 동시에 들어온 추가/삭제가 서로의 변경을 덮어쓰지 않도록 합니다.
+_file_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _get_file_lock(file_path: str) -> asyncio.Lock:
+    lock = _file_locks.get(file_path)
+    if lock is None:
+        lock = _file_locks[file_path] = asyncio.Lock()
+    return lock
+
+
+async def _read_async(file_path: str, reader) -> List[Dict]:
+    if os.path.exists(file_path):
+        return await asyncio.to_thread(reader)
 
-    save_json_file(LOGS_FILE, logs)
+    # 파일이 없으면 읽으면서 기본 데이터를 쓰므로 쓰기와 같은 락 안에서 실행
+    async with _get_file_lock(file_path):
+        return await asyncio.to_thread(reader)
 
 
-def get_logs(hours: int = 24) -> List[Dict]:
-    """로그 조회"""
-    logs = load_json_file(LOGS_FILE, [])
+async def get_products_async() -> List[Dict]:
+    """상품 목록 조회 (비동기)"""
+    return await _read_async(PRODUCTS_FILE, get_products)
+
+
+async def get_stores_async() -> List[Dict]:
+    """매장 목록 조회 (비동기)"""
+    return await _read_async(STORES_FILE, get_stores)
+
+
+async def add_product_async(product_id: str, product_name: str, user_name: str):
+    """상품 추가 (비동기)"""
+    async with _get_file_lock(PRODUCTS_FILE):
+        await asyncio.to_thread(add_product, product_id, product_name, user_name)
+
+
+async def add_store_async(store_id: str, store_name: str, user_name: str):
+    """매장 추가 (비동기)"""
+    async with _get_file_lock(STORES_FILE):
+        await asyncio.to_thread(add_store, store_id, store_name, user_name)
+
+
+async def delete_product_async(product_id: str):
+    """상품 삭제 (비동기)"""
+    async with _get_file_lock(PRODUCTS_FILE):
+        await asyncio.to_thread(delete_product, product_id)
+
+
+async def delete_store_async(store_id: str):
+    """매장 삭제 (비동기)"""
+    async with _get_file_lock(STORES_FILE):
+        await asyncio.to_thread(delete_store, store_id)
+
+
+async def add_log_async(
+    action: str,
+    user_name: str,
+    product_id: str,
+    store_id: str,
+    result: str,
+    details: str = "",
+):
+    """로그 추가 (비동기)"""
+    log_entry = _make_log_entry(
+        await get_products_async(),
+        await get_stores_async(),
+        action,
+        user_name,
+        product_id,
+        store_id,
+        result,
+        details,
+    )
+    await asyncio.to_thread(_append_log, log_entry)
+
 
-    # 시간 필터링은 간단히 최근 100개만 반환
-    return logs[:100]
+async def get_logs_async(hours: int = 24, limit: int = 100) -> List[Dict]:
+    """로그 조회 (비동기)"""
+    return await asyncio.to_thread(get_logs, hours, limit)
@@ -0,0 +1,236 @@
+"""세그먼트 기반 로그 저장소
+
+활성 세그먼트(JSON Lines)에 한 줄씩 추가하고, 크기 또는 시간 기준으로
+롤오버된 세그먼트는 gzip으로 압축해 보관합니다. 세그먼트별 시간 범위는
+인덱스 파일에 기록해 조회 시 겹치는 세그먼트만 엽니다.
+
+보관 기준(기간, 전체 크기)은 프로세스에서 저장소를 처음 열 때와 롤오버할 때
+적용됩니다. 그 사이에는 기준을 넘은 세그먼트가 다음 롤오버까지 남아 있을 수
+있습니다.
+"""
+
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+LOGS_DIR = os.getenv("LOGS_DIR", "config/logs")
+ACTIVE_SEGMENT = "active.jsonl"
+INDEX_FILE = "index.json"
+LEGACY_LOGS_FILE = "config/logs.json"
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 롤오버 기준: 활성 세그먼트 크기(바이트) 또는 첫 로그 이후 경과 시간(초)
+SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(1024 * 1024)))
+SEGMENT_MAX_SECONDS = int(os.getenv("LOG_SEGMENT_MAX_SECONDS", str(24 * 60 * 60)))
+
+# 보관 기준: 보관 기간(일)과 압축 세그먼트 전체 크기(바이트), 0이면 제한 없음
+RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "180"))
+RETENTION_MAX_BYTES = int(os.getenv("LOG_RETENTION_MAX_BYTES", str(200 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_opened = False
+
+
+def _path(name: str) -> str:
+    return os.path.join(LOGS_DIR, name)
+
+
+def _load_index() -> List[Dict]:
+    """세그먼트 인덱스 로드 (오래된 세그먼트가 앞)"""
+    try:
+        with open(_path(INDEX_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _save_index(index: List[Dict]):
+    """인덱스를 임시 파일에 쓴 뒤 교체해 중간 상태가 보이지 않도록 저장"""
+    tmp_path = _path(INDEX_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, _path(INDEX_FILE))
+
+
+def _read_lines(file_path: str, compressed: bool) -> List[Dict]:
+    opener = gzip.open if compressed else open
+    entries = []
+    try:
+        with opener(file_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # 기록 중 잘린 줄은 건너뜀
+    except OSError:
+        return []
+    return entries
+
+
+def _first_timestamp(file_path: str) -> Optional[str]:
+    """활성 세그먼트 첫 줄의 timestamp (파일 전체를 읽지 않음)"""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline()).get("timestamp")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _write_segment(entries: List[Dict], index: List[Dict]):
+    """로그 목록을 gzip 세그먼트로 저장하고 인덱스에 추가"""
+    entries = sorted(entries, key=lambda e: e.get("timestamp", ""))
+    start = entries[0].get("timestamp", "")
+    end = entries[-1].get("timestamp", "")
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    name = f"segment-{stamp}.jsonl.gz"
+
+    with gzip.open(_path(name), "wt", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    index.append(
+        {
+            "file": name,
+            "start": start,
+            "end": end,
+            "count": len(entries),
+            "bytes": os.path.getsize(_path(name)),
+        }
+    )
+
+
+def _roll_over(index: List[Dict]):
+    """활성 세그먼트를 닫아 압축 세그먼트로 전환"""
+    active_path = _path(ACTIVE_SEGMENT)
+    entries = _read_lines(active_path, compressed=False)
+    if entries:
+        _write_segment(entries, index)
+        _save_index(index)
+    os.remove(active_path)
+
+
+def _apply_retention(index: List[Dict]) -> List[Dict]:
+    """보관 기간과 전체 크기 기준을 넘는 오래된 세그먼트 삭제"""
+    kept = list(index)
+
+    if RETENTION_DAYS > 0:
+        cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).strftime(
+            TIMESTAMP_FORMAT
+        )
+        kept = [s for s in kept if s["end"] >= cutoff]
+
+    if RETENTION_MAX_BYTES > 0:
+        total = sum(s["bytes"] for s in kept)
+        while kept and total > RETENTION_MAX_BYTES:
+            total -= kept.pop(0)["bytes"]
+
+    kept_files = {s["file"] for s in kept}
+    for segment in index:
+        if segment["file"] not in kept_files:
+            try:
+                os.remove(_path(segment["file"]))
+            except OSError:
+                pass
+
+    if len(kept) != len(index):
+        _save_index(kept)
+    return kept
+
+
+def _migrate_legacy(index: List[Dict]):
+    """기존 logs.json(최대 1000개 목록)이 있으면 압축 세그먼트로 이관"""
+    try:
+        with open(LEGACY_LOGS_FILE, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except (OSError, ValueError):
+        return
+
+    if not isinstance(legacy, list) or not legacy:
+        return
+
+    _write_segment(legacy, index)
+    _save_index(index)
+    os.replace(LEGACY_LOGS_FILE, LEGACY_LOGS_FILE + ".bak")
+
+
+def _should_roll_over(active_path: str, now: datetime) -> bool:
+    if not os.path.exists(active_path):
+        return False
+    if os.path.getsize(active_path) >= SEGMENT_MAX_BYTES:
+        return True
+    first = _first_timestamp(active_path)
+    if first is None:
+        return False
+    try:
+        opened_at = datetime.strptime(first, TIMESTAMP_FORMAT)
+    except ValueError:
+        return True
+    return (now - opened_at).total_seconds() >= SEGMENT_MAX_SECONDS
+
+
+def _open():
+    """프로세스에서 처음 사용할 때 디렉터리 준비, 기존 로그 이관, 보관 기준 적용"""
+    global _opened
+    if _opened:
+        return
+
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    if not os.path.exists(_path(INDEX_FILE)):
+        index = []
+        _migrate_legacy(index)
+        _save_index(index)
+    _apply_retention(_load_index())
+    _opened = True
+
+
+def append(entry: Dict):
+    """로그 한 건을 활성 세그먼트 끝에 추가"""
+    with _lock:
+        _open()
+        active_path = _path(ACTIVE_SEGMENT)
+
+        if _should_roll_over(active_path, datetime.now()):
+            index = _load_index()
+            _roll_over(index)
+            _apply_retention(index)
+
+        with open(active_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def query(since: Optional[datetime] = None, limit: Optional[int] = None) -> List[Dict]:
+    """since 이후 로그를 최신순으로 반환 (겹치는 세그먼트만 읽음)"""
+    since_str = since.strftime(TIMESTAMP_FORMAT) if since else ""
+
+    with _lock:
+        _open()
+        index = _load_index()
+        results = [
+            e
+            for e in _read_lines(_path(ACTIVE_SEGMENT), compressed=False)
+            if e.get("timestamp", "") >= since_str
+        ]
+        results.reverse()
+
+        # 최신 세그먼트부터 읽고, limit을 채우면 더 오래된 세그먼트는 열지 않음
+        for segment in reversed(index):
+            if limit is not None and len(results) >= limit:
+                break
+            if segment["end"] < since_str:
+                continue
+            entries = _read_lines(_path(segment["file"]), compressed=True)
+            entries = [e for e in entries if e.get("timestamp", "") >= since_str]
+            entries.reverse()
+            results.extend(entries)
+
+    results.sort(key=lambda e: e.get("timestamp", ""), reverse=True)
+    if limit is not None:
+        results = results[:limit]
+    return results
@@ -0,0 +1,163 @@
+"""상품×매장 재고 매트릭스 스냅샷
+
+상품마다 한 번의 조회로 전체 매장 재고를 받아 메모리에 보관합니다.
+만료되었거나 재고 채우기로 변경된 행만 다시 조회하며, 스냅샷 버전을 기준으로
+변경된 행만 내려받을 수 있습니다. 버전은 프로세스마다 새로 시작하므로 epoch가
+다르면 변경분 대신 전체 스냅샷을 돌려줍니다.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from config.data_manager import get_products_async, get_stores_async
+from core import services
+
+# 행을 다시 조회하기까지의 유효 시간(초)과 동시 조회 수
+MATRIX_TTL_SECONDS = float(os.getenv("MATRIX_TTL_SECONDS", "300"))
+MATRIX_CONCURRENCY = int(os.getenv("MATRIX_CONCURRENCY", "8"))
+
+# 프로세스 시작 시 정해지는 스냅샷 식별자 (버전 번호가 어느 스냅샷 기준인지 구분)
+_epoch = uuid.uuid4().hex
+
+# product_id -> {"stores": {store_id: (remain, stocked)}, "fetched_at", "version", "token"}
+_rows: Dict[str, Dict] = {}
+# 스냅샷에서 빠진 상품 -> 빠진 시점의 버전
+_removed: Dict[str, int] = {}
+_errors: Dict[str, str] = {}
+_store_ids: List[str] = []
+_version = 0
+_lock: Optional[asyncio.Lock] = None
+
+# 무효화 카운터: 조회 시작 때 값을 기억해 두고, 조회 중에 바뀌었으면
+# 그 결과는 재고 채우기 이전 값일 수 있으므로 최신으로 취급하지 않음
+_invalidations: Dict[str, int] = {}
+_all_invalidations = 0
+
+
+def mark_stale(product_id: str):
+    """재고가 바뀐 상품 행을 다음 조회 때 다시 가져오도록 표시"""
+    _invalidations[product_id] = _invalidations.get(product_id, 0) + 1
+
+
+def mark_all_stale():
+    """매장 초기화처럼 여러 상품이 바뀐 경우 전체 행을 만료 처리"""
+    global _all_invalidations
+    _all_invalidations += 1
+
+
+def _token(product_id: str) -> tuple:
+    return (_all_invalidations, _invalidations.get(product_id, 0))
+
+
+def _is_stale(product_id: str, row: Optional[Dict], now: float) -> bool:
+    if row is None or row["token"] != _token(product_id):
+        return True
+    return now - row["fetched_at"] >= MATRIX_TTL_SECONDS
+
+
+async def _refresh(product_ids: List[str]) -> Dict[str, tuple]:
+    """만료된 행을 상품당 한 번씩 동시에 조회해 (조회 시작 시 토큰, 결과)로 반환"""
+    semaphore = asyncio.Semaphore(MATRIX_CONCURRENCY)
+
+    async def fetch(product_id: str) -> tuple:
+        async with semaphore:
+            token = _token(product_id)
+            return token, await services.get_product_inventories(product_id)
+
+    results = await asyncio.gather(*(fetch(pid) for pid in product_ids))
+    return dict(zip(product_ids, results))
+
+
+async def _update_snapshot():
+    global _store_ids, _version
+
+    product_ids = [p["id"] for p in await get_products_async()]
+    store_ids = [s["id"] for s in await get_stores_async()]
+    next_version = _version + 1
+    changed = False
+
+    # 매장 목록이 바뀌면 모든 행의 열 구성이 달라지므로 전체 행을 변경으로 취급
+    if store_ids != _store_ids:
+        _store_ids = store_ids
+        for row in _rows.values():
+            row["version"] = next_version
+        changed = True
+
+    for product_id in list(_rows):
+        if product_id not in product_ids:
+            del _rows[product_id]
+            _errors.pop(product_id, None)
+            _removed[product_id] = next_version
+            changed = True
+
+    now = time.monotonic()
+    stale = [pid for pid in product_ids if _is_stale(pid, _rows.get(pid), now)]
+    fetched = await _refresh(stale) if stale else {}
+
+    for product_id, (token, result) in fetched.items():
+        if "error" in result:
+            # 이전 값은 유지하고 다음 조회 때 다시 시도
+            _errors[product_id] = result["error"]
+            continue
+
+        _errors.pop(product_id, None)
+        _removed.pop(product_id, None)
+        row = _rows.get(product_id)
+        if row is None or row["stores"] != result["stores"]:
+            row = {"stores": result["stores"], "version": next_version}
+            _rows[product_id] = row
+            changed = True
+        row["fetched_at"] = now
+        # 조회 중 무효화되었다면 토큰이 달라 다음 조회 때 다시 가져옴
+        row["token"] = token
+
+    if changed:
+        _version = next_version
+
+
+def _to_columns(product_ids: List[str]) -> Dict:
+    """행 목록을 매장별 열 배열로 변환 (값 순서는 products 순서와 동일)"""
+    remain = {sid: [] for sid in _store_ids}
+    stocked = {sid: [] for sid in _store_ids}
+
+    for product_id in product_ids:
+        stores = _rows[product_id]["stores"]
+        for store_id in _store_ids:
+            remain_qty, stocked_qty = stores.get(store_id, (None, None))
+            remain[store_id].append(remain_qty)
+            stocked[store_id].append(stocked_qty)
+
+    return {"remainQuantity": remain, "stockedInQuantity": stocked}
+
+
+async def get_matrix(since: Optional[int] = None, epoch: Optional[str] = None) -> Dict:
+    """재고 매트릭스 조회. since와 epoch를 주면 그 버전 이후 변경된 행만 반환합니다."""
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+
+    async with _lock:
+        await _update_snapshot()
+
+        # 다른 프로세스(재시작 전)의 버전이거나 현재보다 앞선 버전이면 전체 스냅샷
+        full = since is None or epoch != _epoch or since > _version
+        product_ids = [
+            pid for pid, row in _rows.items() if full or row["version"] > since
+        ]
+        removed = [] if full else [
+            pid for pid, version in _removed.items() if version > since
+        ]
+
+        return {
+            "epoch": _epoch,
+            "version": _version,
+            "full": full,
+            "stores": list(_store_ids),
+            "products": product_ids,
+            **_to_columns(product_ids),
+            "removed": removed,
+            "errors": dict(_errors),
+        }
@@ -0,0 +1,167 @@
+"""카탈로그 API 호출 수를 제한하는 공용 스케줄러
+
+토큰 버킷으로 초당 호출 수를, 동시 실행 수 제한으로 in-flight 요청 수를
+제한합니다. 한도를 넘는 요청은 우선순위 대기열에서 기다리며, 단건 재고
+조회(INTERACTIVE)가 재고 채우기/초기화/매트릭스 조회(BULK)보다 먼저 나갑니다.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from common.profiling import span
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# 초당 호출 수와 동시 실행 수, 0 이하이면 제한 없음
+UPSTREAM_RATE = float(os.getenv("UPSTREAM_RATE", "20"))
+UPSTREAM_BURST = float(os.getenv("UPSTREAM_BURST", "20"))
+UPSTREAM_MAX_IN_FLIGHT = int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", "10"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "10"))
+# 대기열 시간 초과 응답(503)에 붙이는 Retry-After(초)
+UPSTREAM_RETRY_AFTER = int(os.getenv("UPSTREAM_RETRY_AFTER", "1"))
+
+
+class UpstreamQueueTimeout(Exception):
+    """대기열에서 기한 안에 실행 차례를 받지 못한 경우"""
+
+
+class UpstreamScheduler:
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_in_flight: int,
+        queue_timeout: float,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {
+            priority: {"count": 0, "timeouts": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+    def _refill(self):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self):
+        """여유가 있는 만큼 대기열 앞쪽(높은 우선순위, 먼저 온 순) 요청을 깨움"""
+        self._refill()
+
+        while self._queue and (
+            self.max_in_flight <= 0 or self._in_flight < self.max_in_flight
+        ):
+            _, _, future = self._queue[0]
+            if future.done():  # 기한 초과 등으로 취소된 요청
+                heapq.heappop(self._queue)
+                continue
+
+            if self.rate > 0 and self._tokens < 1:
+                loop = asyncio.get_running_loop()
+                if self._timer is None or self._timer_loop is not loop:
+                    delay = (1 - self._tokens) / self.rate
+                    self._timer = loop.call_later(delay, self._on_timer)
+                    self._timer_loop = loop
+                break
+
+            heapq.heappop(self._queue)
+            if self.rate > 0:
+                self._tokens -= 1
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _record(self, priority: int, wait_ms: float, timed_out: bool = False):
+        stats = self._stats[priority]
+        stats["count"] += 1
+        stats["wait_ms_total"] += wait_ms
+        stats["wait_ms_max"] = max(stats["wait_ms_max"], wait_ms)
+        if timed_out:
+            stats["timeouts"] += 1
+
+    async def _acquire(self, priority: int, timeout: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._dispatch()
+
+        start = time.perf_counter()
+        try:
+            with span("upstream_queue"):
+                await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # 취소와 동시에 차례를 받았다면 슬롯을 돌려줌
+            if future.done() and not future.cancelled():
+                self._release()
+            wait_ms = (time.perf_counter() - start) * 1000
+            if isinstance(e, asyncio.TimeoutError):
+                self._record(priority, wait_ms, timed_out=True)
+                raise UpstreamQueueTimeout(
+                    f"카탈로그 API 대기열 대기 시간 초과 ({timeout:.1f}초)"
+                ) from None
+            raise
+
+        self._record(priority, (time.perf_counter() - start) * 1000)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = BULK, timeout: Optional[float] = None):
+        """카탈로그 API 호출 한 건을 실행할 차례를 받아 호출이 끝나면 반납"""
+        await self._acquire(priority, self.queue_timeout if timeout is None else timeout)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def metrics(self) -> Dict:
+        """대기열 상태와 우선순위별 대기 시간 지표"""
+        self._refill()
+        waits = {}
+        for priority, stats in self._stats.items():
+            count = stats["count"]
+            waits[PRIORITY_NAMES[priority]] = {
+                "count": count,
+                "timeouts": stats["timeouts"],
+                "wait_ms_avg": round(stats["wait_ms_total"] / count, 1) if count else 0.0,
+                "wait_ms_max": round(stats["wait_ms_max"], 1),
+            }
+
+        return {
+            "in_flight": self._in_flight,
+            "queued": sum(1 for _, _, f in self._queue if not f.done()),
+            "tokens": round(self._tokens, 2),
+            "queue_wait": waits,
+        }
+
+
+upstream = UpstreamScheduler(
+    rate=UPSTREAM_RATE,
+    burst=UPSTREAM_BURST,
+    max_in_flight=UPSTREAM_MAX_IN_FLIGHT,
+    queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+)
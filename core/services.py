@@ -1,14 +1,32 @@
+import asyncio
 import httpx
 import os
+import time
 from dotenv import load_dotenv
 from config.schemas import InventoryPayload
-from config.data_manager import add_log
+from config.data_manager import add_log_async
+from common.profiling import span
+from core.scheduler import upstream, INTERACTIVE, BULK, UpstreamQueueTimeout
 
 load_dotenv()
 
 CATALOG_BASE_URL = os.getenv("CATALOG_BASE_URL", "http://catalog.oymall-aws-dev.local")
 FIXED_QUANTITIES = (100, 100)
 
+# 같은 상품/매장 재고 채우기를 하나로 합치는 대기 시간(ms), 0이면 합치지 않음
+FILL_COALESCE_WINDOW_MS = float(os.getenv("FILL_COALESCE_WINDOW_MS", "50"))
+# Idempotency-Key 결과 보관 시간(초)
+FILL_IDEMPOTENCY_TTL_SECONDS = float(os.getenv("FILL_IDEMPOTENCY_TTL_SECONDS", "600"))
+
+# (product_id, store_id) -> 대기 중인 재고 채우기 {"quantity", "user_name", "task"}
+_pending_fills = {}
+# idempotency_key -> (만료 시각, 요청 내용 (product_id, store_id, quantity), 재고 채우기 task)
+_idempotent_fills = {}
+
+
+class IdempotencyKeyConflict(Exception):
+    """같은 Idempotency-Key로 다른 내용의 재고 채우기를 요청한 경우"""
+
 
 async def get_inventories(product_id: str, store_id: str, user_name: str = ""):
     """특정 상품의 특정 매장 재고 정보를 조회합니다."""
@@ -19,12 +37,15 @@ async def get_inventories(product_id: str, store_id: str, user_name: str = ""):
 
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
+            async with upstream.slot(INTERACTIVE):
+                with span("catalog"):
+                    response = await client.get(url, params=params)
             response.raise_for_status()
 
             from config.schemas import InventoryApiResponse
 
-            api_response = InventoryApiResponse(**response.json())
+            with span("parse"):
+                api_response = InventoryApiResponse(**response.json())
 
             store = next(
                 (s for s in api_response.data.stores if s.storeId == store_id), None
@@ -33,7 +54,7 @@ async def get_inventories(product_id: str, store_id: str, user_name: str = ""):
             if not store:
                 error_msg = f"매장 '{store_id}'에 해당 재고가 없습니다."
                 if user_name:
-                    add_log(
+                    await add_log_async(
                         "check", user_name, product_id, store_id, "error", error_msg
                     )
                 return {"error": error_msg}
@@ -46,7 +67,7 @@ async def get_inventories(product_id: str, store_id: str, user_name: str = ""):
             }
 
             if user_name:
-                add_log(
+                await add_log_async(
                     "check",
                     user_name,
                     product_id,
@@ -60,24 +81,153 @@ async def get_inventories(product_id: str, store_id: str, user_name: str = ""):
     except httpx.HTTPStatusError as e:
         error_msg = f"API 서버 오류 ({e.response.status_code}): {e.response.text}"
         if user_name:
-            add_log("check", user_name, product_id, store_id, "error", error_msg)
+            await add_log_async(
+                "check", user_name, product_id, store_id, "error", error_msg
+            )
         return {"error": error_msg}
     except httpx.RequestError as e:
         error_msg = f"네트워크 연결 오류: {str(e)}"
         if user_name:
-            add_log("check", user_name, product_id, store_id, "error", error_msg)
+            await add_log_async(
+                "check", user_name, product_id, store_id, "error", error_msg
+            )
         return {"error": error_msg}
+    except UpstreamQueueTimeout as e:
+        # 서비스 과부하이므로 오류 응답 대신 예외로 올려 재시도 가능한 상태로 응답
+        if user_name:
+            await add_log_async(
+                "check", user_name, product_id, store_id, "error", str(e)
+            )
+        raise
     except Exception as e:
         error_msg = f"재고 조회 실패: {str(e)}"
         if user_name:
-            add_log("check", user_name, product_id, store_id, "error", error_msg)
+            await add_log_async(
+                "check", user_name, product_id, store_id, "error", error_msg
+            )
         return {"error": error_msg}
 
 
+async def get_product_inventories(product_id: str) -> dict:
+    """상품의 전체 매장 재고를 한 번에 조회합니다. (로그 기록 없음)"""
+    url = f"{CATALOG_BASE_URL}/api/inventories/v1/product/{product_id}"
+
+    try:
+        async with httpx.AsyncClient() as client:
+            async with upstream.slot(BULK):
+                with span("catalog"):
+                    response = await client.get(url, timeout=10.0)
+            response.raise_for_status()
+
+            from config.schemas import InventoryApiResponse
+
+            with span("parse"):
+                api_response = InventoryApiResponse(**response.json())
+
+            return {
+                "productId": product_id,
+                "stores": {
+                    s.storeId: (s.remainQuantity, s.stockedInQuantity)
+                    for s in api_response.data.stores
+                },
+            }
+    except httpx.HTTPStatusError as e:
+        return {
+            "error": f"API 서버 오류 ({e.response.status_code}): {e.response.text}"
+        }
+    except httpx.RequestError as e:
+        return {"error": f"네트워크 연결 오류: {str(e)}"}
+    except Exception as e:
+        return {"error": f"재고 조회 실패: {str(e)}"}
+
+
 async def fill_inventory(
+    product_id: str,
+    store_id: str,
+    quantity: int = None,
+    user_name: str = "",
+    idempotency_key: str = None,
+) -> dict:
+    """재고를 채웁니다.
+
+    같은 상품/매장 요청이 FILL_COALESCE_WINDOW_MS 안에 여러 번 오면 마지막 값으로
+    한 번만 호출하고 결과를 함께 돌려줍니다. 같은 idempotency_key로 다시 온
+    요청은 새로 호출하지 않고 이전 결과를 돌려주며, 요청 내용이 다르면
+    IdempotencyKeyConflict를 발생시킵니다.
+    """
+    if not idempotency_key:
+        return await _coalesced_fill(product_id, store_id, quantity, user_name)
+
+    now = time.monotonic()
+    for key in [k for k, (expires, _, _) in _idempotent_fills.items() if expires <= now]:
+        del _idempotent_fills[key]
+
+    fingerprint = (product_id, store_id, quantity)
+    cached = _idempotent_fills.get(idempotency_key)
+    if cached is None:
+        task = asyncio.ensure_future(
+            _coalesced_fill(product_id, store_id, quantity, user_name)
+        )
+        _idempotent_fills[idempotency_key] = (
+            now + FILL_IDEMPOTENCY_TTL_SECONDS,
+            fingerprint,
+            task,
+        )
+
+        def forget_failed(done_task, key=idempotency_key):
+            # 실패한 요청은 재시도할 수 있도록 보관하지 않음
+            if done_task.cancelled() or done_task.exception() or "error" in done_task.result():
+                if _idempotent_fills.get(key, (None, None, None))[2] is done_task:
+                    del _idempotent_fills[key]
+
+        task.add_done_callback(forget_failed)
+    else:
+        if cached[1] != fingerprint:
+            raise IdempotencyKeyConflict(
+                f"Idempotency-Key '{idempotency_key}'는 "
+                "다른 재고 채우기 요청에 이미 사용되었습니다"
+            )
+        task = cached[2]
+
+    return await asyncio.shield(task)
+
+
+async def _coalesced_fill(
+    product_id: str, store_id: str, quantity: int, user_name: str
+) -> dict:
+    """대기 시간 동안 들어온 같은 상품/매장 요청을 합쳐 한 번만 호출"""
+    if FILL_COALESCE_WINDOW_MS <= 0:
+        return await _fill_inventory_now(product_id, store_id, quantity, user_name)
+
+    key = (product_id, store_id)
+    pending = _pending_fills.get(key)
+    if pending is None:
+        pending = {"quantity": quantity, "user_name": user_name}
+        _pending_fills[key] = pending
+        pending["task"] = asyncio.ensure_future(_flush_fill(key, pending))
+    else:
+        # 마지막 요청 값 우선
+        pending["quantity"] = quantity
+        pending["user_name"] = user_name
+
+    return await asyncio.shield(pending["task"])
+
+
+async def _flush_fill(key: tuple, pending: dict) -> dict:
+    await asyncio.sleep(FILL_COALESCE_WINDOW_MS / 1000)
+    if _pending_fills.get(key) is pending:
+        del _pending_fills[key]
+
+    product_id, store_id = key
+    return await _fill_inventory_now(
+        product_id, store_id, pending["quantity"], pending["user_name"]
+    )
+
+
+async def _fill_inventory_now(
     product_id: str, store_id: str, quantity: int = None, user_name: str = ""
 ) -> dict:
-    """재고를 채웁니다."""
+    """재고 채우기 API를 바로 호출합니다."""
     url = f"{CATALOG_BASE_URL}/api/inventories/v1/qa/save"
 
     if quantity is None:
@@ -99,14 +249,21 @@ async def fill_inventory(
 
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.post(
-                url, json=payload.dict(), params=params, timeout=10.0
-            )
+            async with upstream.slot(BULK):
+                with span("catalog"):
+                    response = await client.post(
+                        url, json=payload.dict(), params=params, timeout=10.0
+                    )
             response.raise_for_status()
-            result = response.json()
+            with span("parse"):
+                result = response.json()
+
+            from core import inventory_matrix
+
+            inventory_matrix.mark_stale(product_id)
 
             if user_name:
-                add_log(
+                await add_log_async(
                     "fill",
                     user_name,
                     product_id,
@@ -119,17 +276,29 @@ async def fill_inventory(
         except httpx.HTTPStatusError as e:
             error_msg = f"API 서버 오류 ({e.response.status_code}): {e.response.text}"
             if user_name:
-                add_log("fill", user_name, product_id, store_id, "error", error_msg)
+                await add_log_async(
+                    "fill", user_name, product_id, store_id, "error", error_msg
+                )
             return {"error": error_msg}
         except httpx.RequestError as e:
             error_msg = f"네트워크 연결 오류: {str(e)}"
             if user_name:
-                add_log("fill", user_name, product_id, store_id, "error", error_msg)
+                await add_log_async(
+                    "fill", user_name, product_id, store_id, "error", error_msg
+                )
             return {"error": error_msg}
+        except UpstreamQueueTimeout as e:
+            if user_name:
+                await add_log_async(
+                    "fill", user_name, product_id, store_id, "error", str(e)
+                )
+            raise
         except Exception as e:
             error_msg = f"재고 채우기 실패: {str(e)}"
             if user_name:
-                add_log("fill", user_name, product_id, store_id, "error", error_msg)
+                await add_log_async(
+                    "fill", user_name, product_id, store_id, "error", error_msg
+                )
             return {"error": error_msg}
 
 
@@ -139,14 +308,24 @@ async def initialize_store_inventory(store_id: str) -> dict:
 
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.get(url, timeout=10.0)
+            async with upstream.slot(BULK):
+                with span("catalog"):
+                    response = await client.get(url, timeout=10.0)
             response.raise_for_status()
-            return response.json()
+            with span("parse"):
+                result = response.json()
+
+            from core import inventory_matrix
+
+            inventory_matrix.mark_all_stale()
+            return result
         except httpx.HTTPStatusError as e:
             return {
                 "error": f"API 서버 오류 ({e.response.status_code}): {e.response.text}"
             }
         except httpx.RequestError as e:
             return {"error": f"네트워크 연결 오류: {str(e)}"}
+        except UpstreamQueueTimeout:
+            raise
         except Exception as e:
             return {"error": f"매장 재고 초기화 실패: {str(e)}"}
@@ -1,18 +1,21 @@
 # Windows용 main.py
-from fastapi import FastAPI, Request, HTTPException, Query
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, HTTPException, Query, Header
+from typing import Optional
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from core import services
+from core import services, inventory_matrix
+from core.scheduler import upstream, UpstreamQueueTimeout, UPSTREAM_RETRY_AFTER
+from common.profiling import timing_middleware
 from config import schemas
 from config.data_manager import (
-    get_products,
-    get_stores,
-    add_product,
-    add_store,
-    delete_product,
-    delete_store,
-    get_logs,
+    get_products_async,
+    get_stores_async,
+    add_product_async,
+    add_store_async,
+    delete_product_async,
+    delete_store_async,
+    get_logs_async,
 )
 import threading
 import webbrowser
@@ -27,6 +30,7 @@ def get_resource_path(relative_path):
     return os.path.join(os.path.abspath("."), relative_path)
 
 app = FastAPI(title="재고 관리 API")
+app.middleware("http")(timing_middleware)
 
 # 정적 파일 설정
 static_path = get_resource_path("static")
@@ -35,12 +39,21 @@ if os.path.exists(static_path):
     app.mount("/static", StaticFiles(directory=static_path), name="static")
     templates = Jinja2Templates(directory=static_path)
 
+@app.exception_handler(UpstreamQueueTimeout)
+async def upstream_queue_timeout_handler(request: Request, exc: UpstreamQueueTimeout):
+    """카탈로그 API 대기열 시간 초과는 과부하이므로 재시도 가능한 503으로 응답"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(UPSTREAM_RETRY_AFTER)},
+    )
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """메인 HTML 페이지를 렌더링합니다."""
     if templates:
-        products = get_products()
-        stores = get_stores()
+        products = await get_products_async()
+        stores = await get_stores_async()
         return templates.TemplateResponse(
             "index.html",
             {"request": request, "products": products, "stores": stores},
@@ -48,6 +61,13 @@ async def read_root(request: Request):
     else:
         return HTMLResponse("<h1>재고 관리 시스템</h1><p>API 서버가 실행 중입니다.</p>")
 
+@app.get("/inventory/matrix")
+async def get_inventory_matrix(
+    since: Optional[int] = Query(None), epoch: Optional[str] = Query(None)
+):
+    """전체 상품×매장 재고 매트릭스를 조회합니다. since/epoch 이후 변경분만 받을 수 있습니다."""
+    return await inventory_matrix.get_matrix(since, epoch)
+
 @app.get("/inventory/{product_id}/{store_id}")
 async def get_inventory(product_id: str, store_id: str, user_name: str = Query("")):
     """특정 상품의 특정 매장 재고를 조회합니다."""
@@ -57,11 +77,21 @@ async def get_inventory(product_id: str, store_id: str, user_name: str = Query("
     return result
 
 @app.post("/inventory/fill")
-async def fill_inventory(request: schemas.FillInventoryRequest):
-    """재고를 채웁니다."""
-    result = await services.fill_inventory(
-        request.product_id, request.store_id, request.quantity, request.user_name
-    )
+async def fill_inventory(
+    request: schemas.FillInventoryRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """재고를 채웁니다. 같은 Idempotency-Key로 재시도하면 이전 결과를 돌려줍니다."""
+    try:
+        result = await services.fill_inventory(
+            request.product_id,
+            request.store_id,
+            request.quantity,
+            request.user_name,
+            idempotency_key,
+        )
+    except services.IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     return {"message": "재고가 성공적으로 채워졌습니다", "data": result}
@@ -81,7 +111,7 @@ async def initialize_store_inventory(store_id: str):
 async def add_product_api(request: schemas.AddProductRequest):
     """상품 추가"""
     try:
-        add_product(request.product_id, request.product_name, request.user_name)
+        await add_product_async(request.product_id, request.product_name, request.user_name)
         return {"message": "상품이 추가되었습니다"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -90,7 +120,7 @@ async def add_product_api(request: schemas.AddProductRequest):
 async def add_store_api(request: schemas.AddStoreRequest):
     """매장 추가"""
     try:
-        add_store(request.store_id, request.store_name, request.user_name)
+        await add_store_async(request.store_id, request.store_name, request.user_name)
         return {"message": "매장이 추가되었습니다"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -99,7 +129,7 @@ async def add_store_api(request: schemas.AddStoreRequest):
 async def delete_product_api(product_id: str):
     """상품 삭제"""
     try:
-        delete_product(product_id)
+        await delete_product_async(product_id)
         return {"message": "상품이 삭제되었습니다"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -108,7 +138,7 @@ async def delete_product_api(product_id: str):
 async def delete_store_api(store_id: str):
     """매장 삭제"""
     try:
-        delete_store(store_id)
+        await delete_store_async(store_id)
         return {"message": "매장이 삭제되었습니다"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -116,17 +146,22 @@ async def delete_store_api(store_id: str):
 @app.get("/api/products")
 async def get_products_api():
     """상품 목록 조회"""
-    return get_products()
+    return await get_products_async()
 
 @app.get("/api/stores")
 async def get_stores_api():
     """매장 목록 조회"""
-    return get_stores()
+    return await get_stores_async()
 
 @app.get("/api/logs")
 async def get_logs_api(hours: int = 24):
     """사용 로그 조회"""
-    return get_logs(hours)
+    return await get_logs_async(hours)
+
+@app.get("/api/metrics/upstream")
+async def get_upstream_metrics_api():
+    """카탈로그 API 대기열 지표 조회"""
+    return upstream.metrics()
 
 def run_server():
     """Uvicorn 서버를 실행하는 함수"""